@@ -2,73 +2,199 @@ import streamlit as st
 import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+import os
+import re
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
 from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import r2_score
 
+CACHE_DIR = Path(".cache") / "yf_history"
+TICKER_RE = re.compile(r"[A-Z0-9.^=-]+")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+TREE_NA = "N/A – tree models cannot extrapolate"
+
 st.set_page_config(page_title="Stock Price Predictor", layout="wide")
 
 st.title("📈 Stock Price Predictor (5-Year Historical Data)")
 
 # --- 1. USER INPUTS ---
-ticker = st.text_input("Enter a stock ticker (e.g., AAPL, MSFT)", value="AAPL").upper()
-predict_date_str = st.text_input("Enter a date to predict (YYYY-MM-DD)", value=(datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d"))
+today = date.today()
+ticker = st.text_input("Enter a stock ticker (e.g., AAPL, MSFT)", value="AAPL").strip().upper()
+predict_date_str = st.text_input("Enter a date to predict (YYYY-MM-DD)", value=(today + timedelta(days=1)).isoformat())
 
 # --- 2. DOWNLOAD DATA ---
+# Ticker.history returns flat OHLCV columns, unlike yf.download's per-ticker
+# MultiIndex. Bars are kept on exchange wall-clock dates.
+def fetch_bars(ticker, start, end):
+    # yf.download turns any per-ticker failure into an empty frame, but
+    # history() re-raises some (rate limits among them); do the same as
+    # download so callers fall back to the cache or "No data found".
+    try:
+        bars = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
+    except Exception:
+        return pd.DataFrame()
+    if bars.empty:
+        return bars
+    bars.index = bars.index.tz_localize(None)
+    return bars[["Open", "High", "Low", "Close", "Volume"]]
+
+# Past daily bars never change, so each ticker's history is kept on disk and
+# only the days after the last cached bar are fetched from Yahoo. The short
+# ttl keeps a failed or partial fetch from sticking for the rest of the day;
+# once the history is complete a re-run is just a pickle read.
+@st.cache_data(ttl=300, show_spinner=False, max_entries=32)
+def load_data(ticker, end_date):
+    start_date = end_date - timedelta(days=5*365)
+    # The ticker is typed by the user and becomes a file name, so refuse
+    # anything that isn't a plain symbol before it can leave CACHE_DIR.
+    if not TICKER_RE.fullmatch(ticker):
+        return pd.DataFrame()
+    path = CACHE_DIR / f"{ticker}.pkl"
+    try:
+        data = pd.read_pickle(path)
+    except Exception:
+        # Missing, or unreadable (e.g. left half-written by a crash).
+        data = fetch_bars(ticker, start_date, end_date)
+    else:
+        last_bar = data.index.max()
+        if last_bar.date() + timedelta(days=1) < end_date:
+            # Re-fetch the last cached bar as well: if its price moved, a split
+            # or dividend has re-adjusted the history and it must be reloaded.
+            new_bars = fetch_bars(ticker, last_bar.date(), end_date)
+            if last_bar in new_bars.index:
+                if np.allclose(new_bars.loc[last_bar, "Close"], data.loc[last_bar, "Close"]):
+                    data = pd.concat([data.iloc[:-1], new_bars])
+                else:
+                    # Keep the stale history if the reload comes back empty.
+                    reloaded = fetch_bars(ticker, start_date, end_date)
+                    if not reloaded.empty:
+                        data = reloaded
+
+    data = data.loc[start_date.isoformat():]
+    if not data.empty:
+        # Write to a temp file and swap it in, so concurrent sessions or a
+        # crash mid-write never leave a truncated pickle behind.
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        try:
+            data.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return data
+
+# --- 3. TRAIN MODELS ---
+# Ordinary least squares on a single feature is just a slope and an intercept.
+def fit_line(x, y):
+    x = x.ravel().astype(np.float64)
+    x_mean, y_mean = x.mean(), y.mean()
+    sxx = ((x - x_mean) ** 2).sum()
+    # A single distinct date has no slope; like sklearn, predict the mean.
+    slope = ((x - x_mean) * (y - y_mean)).sum() / sxx if sxx else 0.0
+    return slope, y_mean - slope * x_mean
+
+def split_data(ticker, end_date):
+    data = load_data(ticker, end_date).dropna()
+    # Days since the Unix epoch, shifted onto date.toordinal()'s scale.
+    data['Date_ordinal'] = data.index.values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+    # sklearn's trees work on float32 features and float64 targets, so hand
+    # them exactly that and skip a conversion on every fit and predict.
+    X = np.ascontiguousarray(data['Date_ordinal'].to_numpy(), dtype=np.float32).reshape(-1, 1)
+    y = data['Close'].to_numpy(dtype=np.float64)
+
+    return train_test_split(X, y, test_size=0.2, shuffle=False)
+
+# Fitted models and their test scores are reused for every date asked about
+# the same ticker on the same day. last_bar is part of the key so models fitted
+# on a stale history are replaced once the missing bars arrive.
+@st.cache_resource(ttl=86400, max_entries=32, show_spinner=False)
+def train_line(ticker, end_date, last_bar):
+    X_train, X_test, y_train, y_test = split_data(ticker, end_date)
+    lr_slope, lr_intercept = fit_line(X_train, y_train)
+    score = r2_score(y_test, lr_slope * X_test.ravel() + lr_intercept)
+    return (lr_slope, lr_intercept), score, (int(X_train.min()), int(X_train.max()))
+
+@st.cache_resource(ttl=86400, max_entries=32, show_spinner=False)
+def train_trees(ticker, end_date, last_bar):
+    X_train, X_test, y_train, y_test = split_data(ticker, end_date)
+
+    dt_model = DecisionTreeRegressor(max_depth=5, random_state=42)
+    dt_model.fit(X_train, y_train)
+
+    rf_model = RandomForestRegressor(n_estimators=100, max_depth=5, random_state=42, n_jobs=-1)
+    rf_model.fit(X_train, y_train)
+
+    scores = {
+        "dt": r2_score(y_test, dt_model.predict(X_test)),
+        "rf": r2_score(y_test, rf_model.predict(X_test)),
+    }
+    return dt_model, rf_model, scores
+
+# A day's tree predictions are fixed once the models are, so repeat queries
+# skip the 100-tree traversal. The script re-executes on every rerun, which
+# would reset a functools.lru_cache; st.cache_data survives it, and the
+# (ticker, end_date, last_bar) key identifies the models it was trained on.
+@st.cache_data(ttl=86400, max_entries=1024, show_spinner=False)
+def predict_trees(ticker, end_date, last_bar, ordinal):
+    dt_model, rf_model, _ = train_trees(ticker, end_date, last_bar)
+    x = np.array([[ordinal]], dtype=np.float32)
+    return dt_model.predict(x)[0], rf_model.predict(x)[0]
+
 if st.button("Run Prediction"):
     with st.spinner(f"Downloading data for {ticker}..."):
-        end_date = datetime.today()
-        start_date = end_date - timedelta(days=5*365)
-        data = yf.download(ticker, start=start_date, end=end_date)
+        data = load_data(ticker, today)
     
     if data.empty:
         st.error("No data found for this ticker.")
     else:
-        data = data.dropna()
-        data['Date'] = data.index
-        data['Date_ordinal'] = pd.to_datetime(data['Date']).map(datetime.toordinal)
-        
-        X = data[['Date_ordinal']]
-        y = data['Close']
-
-        # --- 3. SPLIT DATA ---
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
-
-        # --- 4. TRAIN MODELS ---
-        lr_model = LinearRegression()
-        lr_model.fit(X_train, y_train)
-
-        dt_model = DecisionTreeRegressor(max_depth=5, random_state=42)
-        dt_model.fit(X_train, y_train)
+        last_bar = data.index[-1].date()
+        try:
+            future_date = datetime.strptime(predict_date_str, "%Y-%m-%d")
+        except ValueError:
+            future_date = None
 
-        rf_model = RandomForestRegressor(n_estimators=100, max_depth=5, random_state=42)
-        rf_model.fit(X_train, y_train)
+        with st.spinner("Training models..."):
+            (lr_slope, lr_intercept), lr_score, (first_train_ordinal, last_train_ordinal) = train_line(ticker, today, last_bar)
 
-        # --- 5. TEST MODELS ---
-        y_pred_lr = lr_model.predict(X_test)
-        y_pred_dt = dt_model.predict(X_test)
-        y_pred_rf = rf_model.predict(X_test)
+            # On a single date feature the trees return an edge leaf's mean for
+            # any date before or after the training data, so the (costly) forest
+            # is only fitted when the date falls inside it.
+            use_trees = (
+                future_date is not None
+                and first_train_ordinal <= future_date.toordinal() <= last_train_ordinal
+            )
+            if use_trees:
+                _, _, tree_scores = train_trees(ticker, today, last_bar)
 
+        # --- 4. TEST MODELS ---
         st.subheader("Model Accuracy (R² score)")
-        st.write(f"Linear Regression: {r2_score(y_test, y_pred_lr):.4f}")
-        st.write(f"Decision Tree:     {r2_score(y_test, y_pred_dt):.4f}")
-        st.write(f"Random Forest:     {r2_score(y_test, y_pred_rf):.4f}")
+        st.write(f"Linear Regression: {lr_score:.4f}")
+        if use_trees:
+            st.write(f"Decision Tree:     {tree_scores['dt']:.4f}")
+            st.write(f"Random Forest:     {tree_scores['rf']:.4f}")
+        elif future_date is not None:
+            st.write(f"Decision Tree:     {TREE_NA}")
+            st.write(f"Random Forest:     {TREE_NA}")
 
-        # --- 6. PREDICT USER DATE ---
-        try:
-            future_date = datetime.strptime(predict_date_str, "%Y-%m-%d")
-            future_ordinal = np.array([[future_date.toordinal()]])
-            
-            pred_lr = lr_model.predict(future_ordinal)[0]
-            pred_dt = dt_model.predict(future_ordinal)[0]
-            pred_rf = rf_model.predict(future_ordinal)[0]
+        # --- 5. PREDICT USER DATE ---
+        if future_date is None:
+            st.error("Invalid date format. Use YYYY-MM-DD.")
+        else:
+            pred_lr = lr_slope * future_date.toordinal() + lr_intercept
 
             st.subheader(f"Predicted {ticker} Close Price on {future_date.date()}")
             st.write(f"Linear Regression:  ${pred_lr:.2f}")
-            st.write(f"Decision Tree:      ${pred_dt:.2f}")
-            st.write(f"Random Forest:      ${pred_rf:.2f}")
-        except:
-            st.error("Invalid date format. Use YYYY-MM-DD.")
+            if use_trees:
+                pred_dt, pred_rf = predict_trees(ticker, today, last_bar, future_date.toordinal())
+                st.write(f"Decision Tree:      ${pred_dt:.2f}")
+                st.write(f"Random Forest:      ${pred_rf:.2f}")
+            else:
+                st.write(f"Decision Tree:      {TREE_NA}")
+                st.write(f"Random Forest:      {TREE_NA}")